@@ -1,4 +1,4 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, text
 from sqlalchemy.orm import sessionmaker
 from app.config import settings
 
@@ -8,4 +8,11 @@ SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False, futu
 
 def get_session():
     """Return a new SQLAlchemy session."""
-    return SessionLocal()
\ No newline at end of file
+    return SessionLocal()
+
+def ensure_schema():
+    """Add columns newer code relies on to an existing database."""
+    with engine.begin() as conn:
+        conn.execute(text(
+            "ALTER TABLE transaction_record ADD COLUMN IF NOT EXISTS entry_key VARCHAR(32) UNIQUE"
+        ))
\ No newline at end of file
@@ -10,12 +10,13 @@ from kivymd.uix.pickers import MDDatePicker
 from loguru import logger
 
 from app.services.expenses import (
-    add_transaction,
     query_transactions,
     list_categories,
-    delete_transaction,
     list_accounts,
 )
+from app.db import ensure_schema
+from app.services.journal import journal
+from app.widgets.dialogs import RejectedEntriesPopup
 from app.utils.validation import (
     validate_date,
     validate_amount,
@@ -38,6 +39,11 @@ class MainScreen(BoxLayout):
         super().__init__(**kwargs)
         # Defer data loading until on_start to avoid KV id access before build
         Clock.schedule_once(self._safe_init, 0)
+        self._db_rows: list[dict] = []  # last rows loaded from the DB
+        self._journal_applied = 0
+        self._journal_pending = 0
+        self._journal_rejected = 0
+        Clock.schedule_interval(self._poll_journal, 1.0)
 
     def _safe_init(self, *_):
         try:
@@ -83,12 +89,26 @@ class MainScreen(BoxLayout):
         cat = None if cat == "All" else cat
         return sd, ed, cat
 
-    def refresh_table(self):
+    def refresh_table(self, from_db: bool = True):
+        """Re-render the table; with from_db=False only journal state is re-read."""
         try:
             sd, ed, cat = self._get_filter_values()
-            rows = query_transactions(sd, ed, cat)
+            if from_db:
+                try:
+                    self._db_rows = query_transactions(sd, ed, cat)
+                except Exception as e:
+                    # Offline: fall back to the last loaded rows plus the journal
+                    logger.error(f"Query transactions failed: {e}")
+                    if "error_label" in self.ids:
+                        self.ids.error_label.text = "Database unreachable; showing saved and pending entries."
+            # Hide rows whose delete is journaled but not yet replayed
+            deleted = journal.pending_deletes()
+            rows = [r for r in self._db_rows
+                    if r["id"] not in deleted
+                    and not (sd and r["date"] < sd) and not (ed and r["date"] > ed)
+                    and not (cat and r.get("category") != cat)]
 
-            rv_data = [{
+            rv_data = self._pending_rows(sd, ed, cat) + [{
                 "exp_id": str(r["id"]),
                 "date": r["date"],
                 "category": r.get("category", "Unknown"),
@@ -103,6 +123,24 @@ class MainScreen(BoxLayout):
             if hasattr(self.ids, "error_label"):
                 self.ids.error_label.text = f"Load failed: {e}"
 
+    def _pending_rows(self, sd, ed, cat):
+        # Journaled adds not yet in the DB, newest first; no id, so not deletable
+        names = {v: k for k, v in self.category_map.items()}
+        rows = []
+        for key, txn in reversed(journal.pending_adds()):
+            name = names.get(txn["category_id"], "Unknown")
+            if (sd and txn["transaction_date"] < sd) or (ed and txn["transaction_date"] > ed) \
+                    or (cat and name != cat):
+                continue
+            rows.append({
+                "exp_id": "",
+                "date": txn["transaction_date"],
+                "category": name,
+                "amount": f"{txn['amount']:.2f}",
+                "note": f"(pending) {txn.get('remark') or ''}".strip(),
+            })
+        return rows
+
     def open_date_picker(self):
         picker = MDDatePicker(
             year=date.today().year,
@@ -148,15 +186,13 @@ class MainScreen(BoxLayout):
                 "category_type": txn_type,  # server-side consistency check
             }
 
-            logger.info(f"Adding transaction: {txn}")
-            ok = add_transaction(txn)
-            if not ok:
-                raise ValueError("Insert failed. See logs.")
+            # Acknowledged once on local disk; the journal replays it to the DB
+            key = journal.append("add", txn)
+            logger.info(f"Journaled transaction {key}: {txn}")
 
-            # Refresh datasets and table
-            self.refresh_categories()
-            self.refresh_accounts()
-            self.refresh_table()
+            # Acknowledged on disk; render from the journal without DB round trips
+            self._journal_pending = journal.status()["pending"]
+            self.refresh_table(from_db=False)
 
             # Reset inputs and errors
             if "amount_input" in self.ids:
@@ -176,15 +212,89 @@ class MainScreen(BoxLayout):
             logger.exception(f"Add failed: {e}")
 
     def on_delete(self, rid: int):
+        if not rid:
+            if "error_label" in self.ids:
+                self.ids.error_label.text = "Entry is not saved to the database yet."
+            return
         try:
-            if delete_transaction(int(rid)):
-                logger.info(f"Deleted transaction {rid}")
-                self.refresh_table()
+            key = journal.append("delete", {"id": int(rid)})
+            logger.info(f"Journaled delete of transaction {rid} ({key})")
+            self._journal_pending = journal.status()["pending"]
+            self.refresh_table(from_db=False)
         except Exception as e:
             logger.exception(f"Delete failed: {e}")
             if "error_label" in self.ids:
                 self.ids.error_label.text = f"Delete failed: {e}"
 
+    def _poll_journal(self, *_):
+        status = journal.status()
+        if "journal_label" in self.ids:
+            state = "online" if status["online"] else "offline"
+            text = f"Journal: {state}, {status['pending']} pending"
+            if status["rejected"]:
+                text += f", {status['rejected']} rejected"
+            self.ids.journal_label.text = text
+        # Replayed entries are now in the DB; anything else only needs a re-render
+        if status["applied"] != self._journal_applied:
+            self._journal_applied, self._journal_pending = status["applied"], status["pending"]
+            self.refresh_table()
+        elif status["pending"] != self._journal_pending:
+            self._journal_pending = status["pending"]
+            self.refresh_table(from_db=False)
+        if status["rejected"] > self._journal_rejected:
+            if "error_label" in self.ids:
+                self.ids.error_label.text = "Some entries were rejected by the database."
+            self.open_rejected_entries()
+        self._journal_rejected = status["rejected"]
+
+    def open_rejected_entries(self):
+        entries = journal.rejected_entries()
+        if entries:
+            RejectedEntriesPopup(entries, self._describe_entry, self._retry_rejected,
+                                 self._edit_rejected, self._discard_rejected).open()
+
+    def _describe_entry(self, entry: dict) -> str:
+        data = entry["data"]
+        if entry["op"] == "add":
+            names = {v: k for k, v in self.category_map.items()}
+            category = names.get(data.get("category_id"), "Unknown")
+            return f"Add {data.get('transaction_date')} {category} {data.get('amount')}"
+        if entry["op"] == "delete":
+            return f"Delete transaction {data.get('id')}"
+        return "Unreadable journal entry"
+
+    def _retry_rejected(self, entry: dict):
+        try:
+            journal.retry_rejected(entry["key"])
+            self._journal_pending = journal.status()["pending"]
+            self.refresh_table(from_db=False)
+        except Exception as e:
+            logger.exception(f"Retry failed: {e}")
+            if "error_label" in self.ids:
+                self.ids.error_label.text = f"Retry failed: {e}"
+
+    def _edit_rejected(self, entry: dict):
+        # Load the entry back into the form so the user can correct and resubmit it
+        data = entry["data"]
+        categories = {v: k for k, v in self.category_map.items()}
+        accounts = {v: k for k, v in self.account_map.items()}
+        if "date_input" in self.ids:
+            self.ids.date_input.text = data.get("transaction_date", "")
+        if "amount_input" in self.ids:
+            self.ids.amount_input.text = f"{data.get('amount', '')}"
+        if "category_spinner" in self.ids:
+            self.ids.category_spinner.text = categories.get(data.get("category_id"), "")
+            self.update_type_spinner(self.ids.category_spinner.text)
+        if "account_spinner" in self.ids:
+            self.ids.account_spinner.text = accounts.get(data.get("account_id"), "")
+        if "note_input" in self.ids:
+            self.ids.note_input.text = data.get("remark") or ""
+        self._discard_rejected(entry)
+
+    def _discard_rejected(self, entry: dict):
+        journal.discard_rejected(entry["key"])
+        self._journal_rejected = journal.status()["rejected"]
+
     def refresh_categories(self):
         try:
             raw_categories = list_categories()
@@ -224,8 +334,17 @@ class ExpenseTrackerApp(MDApp):
         return MainScreen()
 
     def on_start(self):
+        try:
+            ensure_schema()
+        except Exception as e:
+            # DB may be offline; the journal keeps entries until it is reachable
+            logger.error(f"Schema check failed: {e}")
+        journal.start()
         logger.info("ExpenseTrackerApp started")
 
+    def on_stop(self):
+        journal.stop()
+
 
 if __name__ == "__main__":
     ExpenseTrackerApp().run()
\ No newline at end of file
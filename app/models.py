@@ -71,6 +71,7 @@ class TransactionRecord(Base):
     category_id: Mapped[int] = mapped_column(ForeignKey("category.category_id"), nullable=False)
     amount: Mapped[Decimal] = mapped_column(Numeric(12, 2), nullable=False)
     remark: Mapped[str | None] = mapped_column(String, nullable=True)
+    entry_key: Mapped[str | None] = mapped_column(String(32), nullable=True, unique=True)  # journal idempotency key
 
     account_rel = relationship("Account", back_populates="transactions")
     category_rel = relationship("Category", back_populates="transactions")
\ No newline at end of file
@@ -1,5 +1,6 @@
 from datetime import date
 from sqlalchemy import func, select
+from sqlalchemy.exc import DataError, IntegrityError
 from sqlalchemy.orm import joinedload
 from loguru import logger
 from app.db import get_session, SessionLocal
@@ -77,7 +78,7 @@ def delete_account(account_id: int) -> bool:
 # ────────────────────────────────
 def ensure_initial_balance(account_id: int, balance: float) -> None:
     with SessionLocal() as session:
-        ib = session.query(InitialBalance).filter_by(account_id=account_id).first()
+        ib = session.query(InitialBalance).filter_by(account_id=account_id).order_by(InitialBalance.id).first()
         if not ib:
             session.add(InitialBalance(account_id=account_id, balance=balance))
         else:
@@ -86,7 +87,7 @@ def ensure_initial_balance(account_id: int, balance: float) -> None:
 
 def get_initial_balance(account_id: int) -> float | None:
     with SessionLocal() as session:
-        ib = session.query(InitialBalance).filter_by(account_id=account_id).first()
+        ib = session.query(InitialBalance).filter_by(account_id=account_id).order_by(InitialBalance.id).first()
         if not ib:
             ib = InitialBalance(account_id=account_id, balance=0.00)
             session.add(ib)
@@ -95,7 +96,7 @@ def get_initial_balance(account_id: int) -> float | None:
 
 def update_initial_balance(account_id: int, new_balance: float) -> bool:
     with SessionLocal() as session:
-        ib = session.query(InitialBalance).filter_by(account_id=account_id).first()
+        ib = session.query(InitialBalance).filter_by(account_id=account_id).order_by(InitialBalance.id).first()
         if not ib:
             return False
         ib.balance = new_balance
@@ -144,24 +145,28 @@ def delete_actual_balance(balance_id: int) -> bool:
 # ────────────────────────────────
 # Transaction Record
 # ────────────────────────────────
+def _new_transaction_record(session, txn: dict, entry_key: str | None = None) -> TransactionRecord:
+    # Optional safety: ensure selected category exists and matches type (if provided)
+    cat = session.get(Category, txn["category_id"])
+    if not cat:
+        raise ValueError("Selected category does not exist.")
+    # If UI passed category_type for validation, ensure consistency
+    if "category_type" in txn and txn["category_type"] and txn["category_type"] != cat.category_type:
+        raise ValueError("Selected category type does not match the category.")
+
+    return TransactionRecord(
+        account_id=txn["account_id"],
+        category_id=txn["category_id"],
+        transaction_date=txn["transaction_date"],
+        amount=txn["amount"],
+        remark=txn.get("remark"),
+        entry_key=entry_key,
+    )
+
 def add_transaction(txn: dict) -> bool:
     session = get_session()
     try:
-        # Optional safety: ensure selected category exists and matches type (if provided)
-        cat = session.get(Category, txn["category_id"])
-        if not cat:
-            raise ValueError("Selected category does not exist.")
-        # If UI passed category_type for validation, ensure consistency
-        if "category_type" in txn and txn["category_type"] and txn["category_type"] != cat.category_type:
-            raise ValueError("Selected category type does not match the category.")
-
-        new_txn = TransactionRecord(
-            account_id=txn["account_id"],
-            category_id=txn["category_id"],
-            transaction_date=txn["transaction_date"],
-            amount=txn["amount"],
-            remark=txn.get("remark"),
-        )
+        new_txn = _new_transaction_record(session, txn)
         session.add(new_txn)
         session.commit()
         logger.info(f"Transaction added: {txn}")
@@ -192,6 +197,44 @@ def delete_transaction(transaction_id: int) -> bool:
         session.commit()
         return True
 
+def apply_journal_entries(entries: list[dict]) -> dict[str, str]:
+    """Apply journaled writes in a single DB transaction.
+
+    Each entry runs in its own savepoint so one bad entry does not sink the batch.
+    Adds already stored under their ``entry_key`` are skipped, which makes replay
+    idempotent. Returns the reason for each rejected entry, keyed by entry key;
+    connection errors propagate so the caller can retry the whole batch later.
+    """
+    rejected: dict[str, str] = {}
+    with SessionLocal() as session:
+        add_keys = [e["key"] for e in entries if e["op"] == "add"]
+        applied_keys = set()
+        if add_keys:
+            applied_keys = set(session.scalars(
+                select(TransactionRecord.entry_key).where(TransactionRecord.entry_key.in_(add_keys))
+            ))
+
+        for entry in entries:
+            try:
+                with session.begin_nested():
+                    if entry["op"] == "add":
+                        if entry["key"] in applied_keys:
+                            continue
+                        session.add(_new_transaction_record(session, entry["data"], entry["key"]))
+                    elif entry["op"] == "delete":
+                        tr = session.get(TransactionRecord, entry["data"]["id"])
+                        if tr:
+                            session.delete(tr)
+                    else:
+                        raise ValueError(f"Unknown journal operation {entry['op']}.")
+                    session.flush()
+            except (ValueError, IntegrityError, DataError) as e:
+                logger.error(f"Journal entry {entry['key']} rejected: {e}")
+                rejected[entry["key"]] = str(e)
+
+        session.commit()
+    return rejected
+
 def query_transactions(start_date=None, end_date=None, category=None):
     with SessionLocal() as session:
         q = session.query(TransactionRecord).options(joinedload(TransactionRecord.category_rel))
@@ -0,0 +1,388 @@
+import json
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from pathlib import Path
+
+from loguru import logger
+from sqlalchemy.exc import DBAPIError, OperationalError
+
+from app.config import settings
+from app.services.expenses import apply_journal_entries
+
+# ────────────────────────────────
+# Write-ahead journal for transaction entry
+# ────────────────────────────────
+# Writes from the UI are appended to a local JSON-lines file and acknowledged
+# once fsynced. A writer thread gathers concurrent appends so one fsync covers
+# the whole group, and a replayer thread pushes the backlog to PostgreSQL in
+# batched transactions. The checkpoint file records the byte offset of the
+# last entry the database has accepted.
+
+def _is_connection_error(e: Exception) -> bool:
+    # Only these mean "try the same batch later"; anything else is about the entries
+    if isinstance(e, OperationalError | ConnectionError):
+        return True
+    return isinstance(e, DBAPIError) and e.connection_invalidated
+
+
+JOURNAL_FILE = "transactions.jsonl"
+CHECKPOINT_FILE = "checkpoint"
+REJECTED_FILE = "rejected.jsonl"
+
+
+class TransactionJournal:
+    def __init__(self, directory: str,
+                 flush_interval: float = settings.JOURNAL_FLUSH_INTERVAL,
+                 replay_batch: int = settings.JOURNAL_REPLAY_BATCH,
+                 replay_interval: float = settings.JOURNAL_REPLAY_INTERVAL,
+                 max_backoff: float = settings.JOURNAL_MAX_BACKOFF,
+                 compact_bytes: int = settings.JOURNAL_COMPACT_BYTES):
+        self.dir = Path(directory)
+        self.flush_interval = flush_interval
+        self.replay_batch = replay_batch
+        self.replay_interval = replay_interval
+        self.max_backoff = max_backoff
+        self.compact_bytes = compact_bytes
+
+        self._cond = threading.Condition()
+        self._io_lock = threading.Lock()  # guards file appends against compaction
+        self._wake = threading.Event()
+        self._queue: list[tuple[dict, dict]] = []  # (entry, waiter) awaiting fsync
+        self._backlog: deque[tuple[int, dict]] = deque()  # (end offset, entry) not yet replayed
+        self._fh = None
+        self._threads: list[threading.Thread] = []
+        self._running = False
+
+        self.online = True
+        self.last_error: str | None = None
+        self.applied = 0
+        self._rejected: list[dict] = []  # mirror of rejected.jsonl
+
+    # ────────────────────────────────
+    # Lifecycle
+    # ────────────────────────────────
+    def start(self) -> None:
+        if self._running:
+            return
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self._recover()
+        self._fh = open(self.dir / JOURNAL_FILE, "ab")
+        self._running = True
+        self._threads = [
+            threading.Thread(target=self._writer_loop, name="journal-writer", daemon=True),
+            threading.Thread(target=self._replay_loop, name="journal-replayer", daemon=True),
+        ]
+        for t in self._threads:
+            t.start()
+        if self._backlog:
+            self._wake.set()
+        logger.info(f"Journal started with {len(self._backlog)} pending entries")
+
+    def stop(self, timeout: float = 5.0) -> None:
+        if not self._running:
+            return
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        self._wake.set()
+        for t in self._threads:
+            t.join(timeout)
+
+        # Nothing will write these any more; release their callers
+        with self._cond:
+            stranded, self._queue = self._queue, []
+        for _, waiter in stranded:
+            waiter["error"] = RuntimeError("Journal stopped before the entry was written.")
+            waiter["done"].set()
+
+        alive = [t.name for t in self._threads if t.is_alive()]
+        if alive:
+            # Still blocked (e.g. connecting to the DB); it may yet touch the file
+            logger.warning(f"Journal threads still running after stop: {alive}")
+        else:
+            with self._io_lock:
+                self._fh.close()
+                self._fh = None
+        logger.info(f"Journal stopped with {len(self._backlog)} pending entries")
+
+    def _recover(self) -> None:
+        path = self.dir / JOURNAL_FILE
+        if not path.exists():
+            path.touch()
+        data = path.read_bytes()
+
+        # Drop a torn tail left by a crash mid-append; it was never acknowledged
+        end = data.rfind(b"\n") + 1
+        if end < len(data):
+            logger.warning(f"Journal: discarding {len(data) - end} bytes of incomplete entry")
+            with open(path, "r+b") as fh:
+                fh.truncate(end)
+                os.fsync(fh.fileno())
+            data = data[:end]
+
+        offset = self._read_checkpoint()
+        if offset > len(data):
+            # Compaction truncated the journal but crashed before resetting the
+            # checkpoint; everything that was in the file had been replayed
+            logger.warning(f"Journal: checkpoint {offset} is past the end of the journal, resetting to 0")
+            offset = 0
+            self._write_checkpoint(0)
+        elif offset and data[offset - 1:offset] != b"\n":
+            # Never replay from the start: a re-inserted add would outlive a later
+            # delete of its row. Skip forward to the next entry boundary instead.
+            boundary = data.find(b"\n", offset) + 1
+            logger.warning(f"Journal: checkpoint {offset} is mid-entry, moving to {boundary}")
+            offset = boundary
+            self._write_checkpoint(offset)
+
+        self._rejected = self._read_rejected()
+        self._backlog.clear()
+        pos = offset
+        for line in data[offset:].splitlines(keepends=True):
+            pos += len(line)
+            try:
+                entry = json.loads(line)
+            except ValueError as e:
+                logger.error(f"Journal: skipping unreadable entry at offset {pos - len(line)}: {e}")
+                self._record_rejected([{"key": uuid.uuid4().hex, "op": "unreadable",
+                                        "data": {"raw": line.decode("utf-8", "replace")},
+                                        "reason": f"Unreadable journal entry: {e}"}])
+                # Move the checkpoint past the bad line once what precedes it is replayed
+                if self._backlog:
+                    self._backlog[-1] = (pos, self._backlog[-1][1])
+                else:
+                    self._write_checkpoint(pos)
+                continue
+            self._backlog.append((pos, entry))
+
+    # ────────────────────────────────
+    # Writes
+    # ────────────────────────────────
+    def append(self, op: str, data: dict) -> str:
+        """Journal a write and return its idempotency key once it is on disk."""
+        entry = {"key": uuid.uuid4().hex, "op": op, "data": data}
+        waiter = {"done": threading.Event(), "error": None}
+        with self._cond:
+            # Checked under the lock so stop() cannot slip in before the enqueue
+            if not self._running:
+                raise RuntimeError("Journal is not running.")
+            self._queue.append((entry, waiter))
+            self._cond.notify()
+        waiter["done"].wait()
+        if waiter["error"]:
+            raise waiter["error"]
+        return entry["key"]
+
+    def _writer_loop(self) -> None:
+        while True:
+            with self._cond:
+                while not self._queue and self._running:
+                    self._cond.wait()
+                if not self._queue and not self._running:
+                    return
+            # Give concurrent writers a moment to join this fsync
+            if self.flush_interval:
+                time.sleep(self.flush_interval)
+            with self._cond:
+                group, self._queue = self._queue, []
+            self._write_group(group)
+
+    def _write_group(self, group: list[tuple[dict, dict]]) -> None:
+        lines = [(json.dumps(entry, default=str) + "\n").encode("utf-8") for entry, _ in group]
+        error = None
+        with self._io_lock:
+            pos = None
+            try:
+                pos = self._fh.seek(0, os.SEEK_END)
+                self._fh.write(b"".join(lines))
+                self._fh.flush()
+                os.fsync(self._fh.fileno())
+            except OSError as e:
+                logger.exception(f"Journal write failed: {e}")
+                error = e
+                # The caller is told the write failed, so it must not resurface on replay
+                if pos is not None:
+                    try:
+                        self._fh.truncate(pos)
+                        os.fsync(self._fh.fileno())
+                    except OSError as te:
+                        logger.exception(f"Journal rollback to offset {pos} failed: {te}")
+            else:
+                with self._cond:
+                    for (entry, _), line in zip(group, lines):
+                        pos += len(line)
+                        self._backlog.append((pos, entry))
+
+        for _, waiter in group:
+            waiter["error"] = error
+            waiter["done"].set()
+        if error is None:
+            self._wake.set()
+
+    # ────────────────────────────────
+    # Replay
+    # ────────────────────────────────
+    def _replay_loop(self) -> None:
+        delay = self.replay_interval
+        while self._running:
+            self._wake.wait(delay)
+            self._wake.clear()
+            if not self._running:
+                return
+            try:
+                while self._running and self._replay_once():
+                    pass
+                self.online, self.last_error = True, None
+                delay = self.replay_interval
+            except Exception as e:
+                if self.online:
+                    logger.error(f"Journal replay failed, will retry: {e}")
+                self.online, self.last_error = False, str(e)
+                delay = min(max(delay, self.replay_interval) * 2, self.max_backoff)
+
+    def _replay_once(self) -> bool:
+        with self._cond:
+            batch = [self._backlog[i] for i in range(min(self.replay_batch, len(self._backlog)))]
+        if not batch:
+            return False
+
+        rejected = self._apply([entry for _, entry in batch])
+        if rejected:
+            self._record_rejected([{**entry, "reason": rejected[entry["key"]]}
+                                   for _, entry in batch if entry["key"] in rejected])
+
+        with self._cond:
+            for _ in batch:
+                self._backlog.popleft()
+            remaining = len(self._backlog)
+        self._write_checkpoint(batch[-1][0])
+        self.applied += len(batch) - len(rejected)
+
+        if not remaining:
+            self._compact()
+        return remaining > 0
+
+    def _apply(self, entries: list[dict]) -> dict[str, str]:
+        try:
+            return apply_journal_entries(entries)
+        except Exception as e:
+            if _is_connection_error(e):
+                raise
+            # Bisect so one bad entry cannot hold up the rest of the backlog
+            if len(entries) == 1:
+                logger.error(f"Journal entry {entries[0]['key']} failed: {e}")
+                return {entries[0]["key"]: f"{type(e).__name__}: {e}"}
+            mid = len(entries) // 2
+            return {**self._apply(entries[:mid]), **self._apply(entries[mid:])}
+
+    def _record_rejected(self, entries: list[dict]) -> None:
+        # Keep rejected entries so the user's input is never silently dropped
+        with self._cond:
+            with open(self.dir / REJECTED_FILE, "ab") as fh:
+                fh.write(b"".join((json.dumps(e, default=str) + "\n").encode("utf-8") for e in entries))
+                fh.flush()
+                os.fsync(fh.fileno())
+            self._rejected.extend(entries)
+
+    def _read_rejected(self) -> list[dict]:
+        path = self.dir / REJECTED_FILE
+        if not path.exists():
+            return []
+        entries = []
+        for line in path.read_bytes().splitlines():
+            try:
+                entries.append(json.loads(line))
+            except ValueError:
+                logger.error("Journal: skipping unreadable line in rejected entries")
+        return entries
+
+    # ────────────────────────────────
+    # Rejected entries
+    # ────────────────────────────────
+    def rejected_entries(self) -> list[dict]:
+        with self._cond:
+            return list(self._rejected)
+
+    def discard_rejected(self, key: str) -> bool:
+        with self._cond:
+            kept = [e for e in self._rejected if e["key"] != key]
+            if len(kept) == len(self._rejected):
+                return False
+            tmp = self.dir / (REJECTED_FILE + ".tmp")
+            with open(tmp, "wb") as fh:
+                fh.write(b"".join((json.dumps(e, default=str) + "\n").encode("utf-8") for e in kept))
+                fh.flush()
+                os.fsync(fh.fileno())
+            os.replace(tmp, self.dir / REJECTED_FILE)
+            self._rejected = kept
+        return True
+
+    def retry_rejected(self, key: str) -> str:
+        """Journal a rejected entry again and drop it from the rejected list."""
+        entry = next((e for e in self.rejected_entries() if e["key"] == key), None)
+        if entry is None or entry["op"] not in ("add", "delete"):
+            raise ValueError("Entry cannot be retried.")
+        new_key = self.append(entry["op"], entry["data"])
+        self.discard_rejected(key)
+        return new_key
+
+    def _compact(self) -> None:
+        with self._io_lock:
+            if self._fh is None:
+                return
+            with self._cond:
+                if self._backlog:
+                    return
+            if self._fh.seek(0, os.SEEK_END) < self.compact_bytes:
+                return
+            # Truncate first: a crash before the checkpoint reset leaves it past
+            # the end of an empty journal, which _recover resets to 0. The other
+            # order would replay the whole journal.
+            self._fh.truncate(0)
+            os.fsync(self._fh.fileno())
+            self._write_checkpoint(0)
+        logger.info("Journal compacted")
+
+    def _read_checkpoint(self) -> int:
+        try:
+            return int((self.dir / CHECKPOINT_FILE).read_text().strip() or 0)
+        except FileNotFoundError:
+            return 0
+
+    def _write_checkpoint(self, offset: int) -> None:
+        tmp = self.dir / (CHECKPOINT_FILE + ".tmp")
+        with open(tmp, "w") as fh:
+            fh.write(str(offset))
+            fh.flush()
+            os.fsync(fh.fileno())
+        os.replace(tmp, self.dir / CHECKPOINT_FILE)
+
+    # ────────────────────────────────
+    # Status
+    # ────────────────────────────────
+    def status(self) -> dict:
+        with self._cond:
+            pending = len(self._backlog)
+            rejected = len(self._rejected)
+        return {
+            "running": self._running,
+            "online": self.online,
+            "pending": pending,
+            "applied": self.applied,
+            "rejected": rejected,
+            "last_error": self.last_error,
+        }
+
+    def pending_adds(self) -> list[tuple[str, dict]]:
+        with self._cond:
+            return [(e["key"], e["data"]) for _, e in self._backlog if e["op"] == "add"]
+
+    def pending_deletes(self) -> set[int]:
+        with self._cond:
+            return {int(e["data"]["id"]) for _, e in self._backlog if e["op"] == "delete"}
+
+
+journal = TransactionJournal(settings.JOURNAL_DIR)
@@ -0,0 +1,354 @@
+import argparse
+import csv
+import hashlib
+import json
+import os
+import re
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import date, timedelta
+from decimal import Decimal
+from pathlib import Path
+
+from sqlalchemy import case, func, select
+from sqlalchemy.dialects.postgresql import aggregate_order_by
+from loguru import logger
+
+from app.config import settings
+from app.db import SessionLocal, engine
+from app.models import Account, Category, InitialBalance, ActualBalance, TransactionRecord
+
+# ────────────────────────────────
+# Period-close statements
+# ────────────────────────────────
+# The parent process plans one job per (account, period) from a single
+# aggregate query, fingerprints each job's inputs and skips those whose
+# fingerprint matches the manifest. Remaining jobs run across a process pool;
+# each worker streams only its own slice of transactions and writes its
+# outputs under EXPORT_DIR/statements.
+
+PERIOD_FORMATS = {"month": "YYYY-MM", "year": "YYYY"}
+MANIFEST_FILE = "manifest.json"
+STREAM_CHUNK = 1000
+
+
+def _signed_amount():
+    # Debit categories (salary, reimbursement) add to the balance, Credit ones subtract
+    return case((Category.category_type == "Debit", TransactionRecord.amount),
+                else_=-TransactionRecord.amount)
+
+
+def _period_bounds(granularity: str, period: str) -> tuple[date, date]:
+    if granularity == "year":
+        year = int(period)
+        return date(year, 1, 1), date(year, 12, 31)
+    year, month = map(int, period.split("-"))
+    start = date(year, month, 1)
+    next_start = date(year + month // 12, month % 12 + 1, 1)
+    return start, next_start - timedelta(days=1)
+
+
+def _account_dir(account_id: int, account_name: str) -> str:
+    return f"{account_id}_{re.sub(r'[^A-Za-z0-9_-]+', '_', account_name)}"
+
+
+# ────────────────────────────────
+# Planning (parent process)
+# ────────────────────────────────
+def _period_key(granularity: str, d: date) -> str:
+    return f"{d:%Y}" if granularity == "year" else f"{d:%Y-%m}"
+
+
+def plan_statement_jobs(granularities: tuple[str, ...] = ("month", "year"),
+                        account_ids: list[int] | None = None) -> list[dict]:
+    """Build one job per (account, period) with transactions or actual balances.
+
+    Accounts with neither still get a statement for the current period so their
+    initial balance is reported.
+    """
+    with SessionLocal() as session:
+        accounts = {a.account_id: a.account_name for a in session.query(Account).all()
+                    if not account_ids or a.account_id in account_ids}
+        # Same row get_initial_balance picks: the first per account by id
+        initial = {}
+        for ib in session.query(InitialBalance).order_by(InitialBalance.id):
+            initial.setdefault(ib.account_id, ib.balance)
+
+        actuals = defaultdict(list)
+        for ab in session.query(ActualBalance).order_by(ActualBalance.transaction_date, ActualBalance.id):
+            actuals[ab.account_id].append((ab.transaction_date, ab.amount))
+
+        jobs = []
+        for granularity in granularities:
+            period = func.to_char(TransactionRecord.transaction_date, PERIOD_FORMATS[granularity]).label("period")
+            # Digest of every row in the slice; any edit, insert, delete or
+            # category rename changes it
+            digest = func.md5(func.string_agg(
+                func.concat_ws("|", TransactionRecord.id, TransactionRecord.transaction_date,
+                               Category.category_name, Category.category_type,
+                               TransactionRecord.amount, func.coalesce(TransactionRecord.remark, "")),
+                aggregate_order_by(",", TransactionRecord.id)
+            )).label("digest")
+
+            stmt = select(
+                TransactionRecord.account_id,
+                period,
+                func.count().label("rows"),
+                func.sum(_signed_amount()).label("net"),
+                digest,
+            ).join(Category, TransactionRecord.category_id == Category.category_id) \
+             .group_by(TransactionRecord.account_id, period)
+            if account_ids:
+                stmt = stmt.where(TransactionRecord.account_id.in_(account_ids))
+
+            # (account, period) -> (rows, net, digest); periods holding only
+            # actual balances move nothing but still need their check
+            slices = {(account_id, period_key): (rows, net, digest_value)
+                      for account_id, period_key, rows, net, digest_value in session.execute(stmt)}
+            for account_id in accounts:
+                for d, _ in actuals[account_id]:
+                    slices.setdefault((account_id, _period_key(granularity, d)), (0, Decimal("0.00"), None))
+            for account_id in accounts.keys() - {a for a, _ in slices}:
+                slices[(account_id, _period_key(granularity, date.today()))] = (0, Decimal("0.00"), None)
+
+            running = {}
+            for (account_id, period_key), (rows, net, digest_value) in sorted(slices.items()):
+                if account_id not in accounts:
+                    continue
+                opening = running.get(account_id, initial.get(account_id, Decimal("0.00")))
+                running[account_id] = opening + net
+                start, end = _period_bounds(granularity, period_key)
+                period_actuals = [(d.isoformat(), str(a)) for d, a in actuals[account_id] if start <= d <= end]
+
+                job = {
+                    "account_id": account_id,
+                    "account_name": accounts[account_id],
+                    "granularity": granularity,
+                    "period": period_key,
+                    "start": start.isoformat(),
+                    "end": end.isoformat(),
+                    "rows": rows,
+                    "opening": str(opening),
+                    "actuals": period_actuals,
+                }
+                job["fingerprint"] = hashlib.sha256(json.dumps(
+                    [digest_value, job["account_name"], job["opening"], period_actuals]
+                ).encode("utf-8")).hexdigest()
+                jobs.append(job)
+        return jobs
+
+
+# ────────────────────────────────
+# Generation (worker processes)
+# ────────────────────────────────
+def _init_worker() -> None:
+    # Pooled connections inherited from the parent must not be reused here
+    engine.dispose(close=False)
+
+
+def generate_statement(job: dict, out_dir: str) -> dict:
+    """Stream one (account, period) slice and write its CSV and summary."""
+    started = time.perf_counter()
+    target = Path(out_dir) / _account_dir(job["account_id"], job["account_name"]) / job["granularity"]
+    target.mkdir(parents=True, exist_ok=True)
+    csv_path = target / f"{job['period']}.csv"
+    summary_path = target / f"{job['period']}.json"
+
+    opening = Decimal(job["opening"])
+    balance = opening
+    by_category: dict[str, Decimal] = defaultdict(Decimal)
+    pending_actuals = [(date.fromisoformat(d), Decimal(a)) for d, a in job["actuals"]]
+    checks = []
+
+    def settle_actuals(until: date | None):
+        # Compare each actual balance against the running balance at end of its day
+        while pending_actuals and (until is None or pending_actuals[0][0] < until):
+            actual_date, actual_amount = pending_actuals.pop(0)
+            checks.append({
+                "date": actual_date.isoformat(),
+                "actual": float(actual_amount),
+                "computed": float(balance),
+                "difference": float(actual_amount - balance),
+            })
+
+    stmt = select(
+        TransactionRecord.id,
+        TransactionRecord.transaction_date,
+        Category.category_name,
+        Category.category_type,
+        TransactionRecord.amount,
+        TransactionRecord.remark,
+    ).join(Category, TransactionRecord.category_id == Category.category_id) \
+     .where(TransactionRecord.account_id == job["account_id"],
+            TransactionRecord.transaction_date >= date.fromisoformat(job["start"]),
+            TransactionRecord.transaction_date <= date.fromisoformat(job["end"])) \
+     .order_by(TransactionRecord.transaction_date, TransactionRecord.id) \
+     .execution_options(yield_per=STREAM_CHUNK)
+
+    tmp_csv = csv_path.with_suffix(".csv.tmp")
+    tmp_summary = summary_path.with_suffix(".json.tmp")
+    try:
+        with SessionLocal() as session, open(tmp_csv, "w", newline="", encoding="utf-8") as fh:
+            writer = csv.writer(fh)
+            writer.writerow(["id", "date", "category", "type", "amount", "balance", "note"])
+            # Periods planned only for their actual balances have no rows to fetch
+            rows = session.execute(stmt) if job["rows"] else ()
+            for rid, txn_date, cat_name, cat_type, amount, remark in rows:
+                settle_actuals(txn_date)
+                balance += amount if cat_type == "Debit" else -amount
+                by_category[cat_name] += amount
+                writer.writerow([rid, txn_date.isoformat(), cat_name, cat_type, f"{amount:.2f}", f"{balance:.2f}", remark or ""])
+        settle_actuals(None)
+
+        summary = {
+            "account": job["account_name"],
+            "granularity": job["granularity"],
+            "period": job["period"],
+            "opening_balance": float(opening),
+            "categories": [{"category": c, "total": float(t)} for c, t in sorted(by_category.items())],
+            "closing_balance": float(balance),
+            "actual_balance_checks": checks,
+            "reconciled": all(c["difference"] == 0 for c in checks),
+        }
+        tmp_summary.write_text(json.dumps(summary, indent=2), encoding="utf-8")
+        os.replace(tmp_csv, csv_path)
+        os.replace(tmp_summary, summary_path)
+    finally:
+        # Leave no partial files behind if the worker fails part way
+        tmp_csv.unlink(missing_ok=True)
+        tmp_summary.unlink(missing_ok=True)
+
+    return {"summary": summary, "files": [str(csv_path), str(summary_path)],
+            "seconds": time.perf_counter() - started}
+
+
+# ────────────────────────────────
+# Orchestration
+# ────────────────────────────────
+def _job_id(job: dict) -> str:
+    return f"{job['account_id']}/{job['granularity']}/{job['period']}"
+
+
+def _remove_files(files, out_dir: Path) -> None:
+    for f in files:
+        path = Path(f)
+        path.unlink(missing_ok=True)
+        # Drop directories left empty, e.g. after an account rename
+        for parent in path.parents:
+            if parent == out_dir or out_dir not in parent.parents:
+                break
+            try:
+                parent.rmdir()
+            except OSError:
+                break
+
+
+def _load_manifest(path: Path) -> dict:
+    try:
+        return json.loads(path.read_text(encoding="utf-8"))
+    except FileNotFoundError:
+        return {}
+    except ValueError as e:
+        logger.warning(f"Statement manifest unreadable, regenerating all: {e}")
+        return {}
+
+
+def generate_statements(granularities: tuple[str, ...] = ("month", "year"),
+                        account_ids: list[int] | None = None,
+                        max_workers: int | None = settings.STATEMENT_WORKERS,
+                        force: bool = False) -> dict:
+    """Generate period-close statements under EXPORT_DIR/statements.
+
+    Returns counts of generated, skipped and failed jobs, the statements removed
+    because their period no longer has data, wall-clock seconds per stage and the
+    summed worker time. Removal only happens when no account filter is given.
+    """
+    out_dir = Path(settings.EXPORT_DIR) / "statements"
+    out_dir.mkdir(parents=True, exist_ok=True)
+    manifest_path = out_dir / MANIFEST_FILE
+    timings = {}
+
+    started = time.perf_counter()
+    jobs = plan_statement_jobs(granularities, account_ids)
+    timings["plan"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    manifest = _load_manifest(manifest_path)
+    todo = []
+    for job in jobs:
+        entry = manifest.get(_job_id(job))
+        if (not force and entry and entry["fingerprint"] == job["fingerprint"]
+                and all(os.path.exists(f) for f in entry["files"])):
+            continue
+        todo.append(job)
+    timings["diff"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    worker_seconds = 0.0
+    failed = []
+    if todo:
+        with ProcessPoolExecutor(max_workers=max_workers or None, initializer=_init_worker) as pool:
+            futures = {pool.submit(generate_statement, job, str(out_dir)): job for job in todo}
+            for future in as_completed(futures):
+                job = futures[future]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    logger.exception(f"Statement {_job_id(job)} failed: {e}")
+                    failed.append(_job_id(job))
+                    # Keep tracking the previous files so pruning still covers them,
+                    # but make sure the job is retried next run
+                    if _job_id(job) in manifest:
+                        manifest[_job_id(job)]["fingerprint"] = None
+                    continue
+                worker_seconds += result["seconds"]
+                previous = manifest.get(_job_id(job), {}).get("files", [])
+                # An account rename moves the output; drop the old copies
+                _remove_files([f for f in previous if f not in result["files"]], out_dir)
+                manifest[_job_id(job)] = {"fingerprint": job["fingerprint"], "files": result["files"]}
+    timings["generate"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    removed = []
+    if not account_ids:
+        # Statements whose (account, period) no longer has any data are outdated
+        planned = {_job_id(job) for job in jobs}
+        for job_id in list(manifest):
+            if job_id.split("/")[1] in granularities and job_id not in planned:
+                _remove_files(manifest.pop(job_id)["files"], out_dir)
+                removed.append(job_id)
+    timings["prune"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    tmp = manifest_path.with_suffix(".json.tmp")
+    tmp.write_text(json.dumps(manifest, indent=2, sort_keys=True), encoding="utf-8")
+    os.replace(tmp, manifest_path)
+    timings["manifest"] = time.perf_counter() - started
+
+    report = {
+        "planned": len(jobs),
+        "generated": len(todo) - len(failed),
+        "skipped": len(jobs) - len(todo),
+        "failed": failed,
+        "removed": removed,
+        "timings": timings,
+        "worker_seconds": worker_seconds,
+    }
+    logger.info(
+        f"Statements: {report['generated']} generated, {report['skipped']} unchanged, "
+        f"{len(failed)} failed, {len(removed)} removed; " + ", ".join(f"{k} {v:.2f}s" for k, v in timings.items())
+        + f", worker total {worker_seconds:.2f}s"
+    )
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate period-close statements.")
+    parser.add_argument("--granularity", choices=sorted(PERIOD_FORMATS), action="append",
+                        help="Period size; repeat for several (default: month and year)")
+    parser.add_argument("--account", type=int, action="append", help="Account id; repeat for several")
+    parser.add_argument("--workers", type=int, default=settings.STATEMENT_WORKERS)
+    parser.add_argument("--force", action="store_true", help="Regenerate even unchanged periods")
+    args = parser.parse_args()
+    generate_statements(tuple(args.granularity or ("month", "year")), args.account, args.workers, args.force)
@@ -43,4 +43,33 @@ class EditExpensePopup(Popup):
             self.dismiss()
         except Exception:
             # keep it simple; you can add error labels
-            self.dismiss()
\ No newline at end of file
+            self.dismiss()
+
+class RejectedEntriesPopup(Popup):
+    def __init__(self, entries: list[dict], describe, on_retry, on_edit, on_discard, **kwargs):
+        super().__init__(**kwargs)
+        self.title = f"Rejected entries ({len(entries)})"
+        self.size_hint = (0.8, 0.8)
+        self.auto_dismiss = True
+
+        layout = BoxLayout(orientation='vertical', spacing=8, padding=8)
+        for entry in entries:
+            row = BoxLayout(size_hint_y=None, height=60, spacing=8)
+            row.add_widget(Label(text=f"{describe(entry)}\n{entry.get('reason', '')}",
+                                 halign='left', valign='middle'))
+            editable = entry["op"] == "add"
+            retryable = entry["op"] in ("add", "delete")
+            row.add_widget(Button(text="Retry", size_hint_x=None, width=80, disabled=not retryable,
+                                  on_release=lambda _, e=entry: self._act(on_retry, e)))
+            row.add_widget(Button(text="Edit", size_hint_x=None, width=80, disabled=not editable,
+                                  on_release=lambda _, e=entry: self._act(on_edit, e)))
+            row.add_widget(Button(text="Discard", size_hint_x=None, width=80,
+                                  on_release=lambda _, e=entry: self._act(on_discard, e)))
+            layout.add_widget(row)
+        layout.add_widget(Button(text="Close", size_hint_y=None, height=40, on_release=lambda *_: self.dismiss()))
+
+        self.content = layout
+
+    def _act(self, action, entry: dict):
+        action(entry)
+        self.dismiss()
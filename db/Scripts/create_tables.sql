@@ -123,5 +123,9 @@ CREATE TABLE IF NOT EXISTS transaction_record (
 	account_id INT REFERENCES account(account_id),
 	category_id INT REFERENCES category(category_id),
 	amount NUMERIC(15, 2) DEFAULT 0.00,
-	remark TEXT
+	remark TEXT,
+	entry_key VARCHAR(32) UNIQUE
 );
+
+-- Existing databases: add the journal idempotency key in place
+ALTER TABLE transaction_record ADD COLUMN IF NOT EXISTS entry_key VARCHAR(32) UNIQUE;
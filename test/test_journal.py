@@ -0,0 +1,318 @@
+import json
+import threading
+import time
+
+import pytest
+from sqlalchemy.exc import OperationalError
+
+import app.services.journal as journal_module
+from app.services.journal import TransactionJournal, JOURNAL_FILE, CHECKPOINT_FILE, REJECTED_FILE
+
+
+class FakeDB:
+    """Stands in for apply_journal_entries; can be taken offline or reject entries."""
+
+    def __init__(self):
+        self.online = True
+        self.reject: dict[str, str] = {}  # remark -> reason
+        self.applied: list[dict] = []
+        self.crash_on: set[str] = set()  # remarks that make the whole call raise
+
+    def __call__(self, entries):
+        if not self.online:
+            raise OperationalError("SELECT 1", {}, Exception("database unreachable"))
+        for e in entries:
+            if e["data"].get("remark") in self.crash_on:
+                raise KeyError("id")
+        rejected = {}
+        for e in entries:
+            reason = self.reject.get(e["data"].get("remark"))
+            if reason:
+                rejected[e["key"]] = reason
+            else:
+                self.applied.append(e)
+        return rejected
+
+
+@pytest.fixture
+def db(monkeypatch):
+    fake = FakeDB()
+    monkeypatch.setattr(journal_module, "apply_journal_entries", fake)
+    return fake
+
+
+def make_journal(path, **kwargs):
+    options = {"flush_interval": 0, "replay_interval": 0.05, "max_backoff": 0.1, "compact_bytes": 1 << 20}
+    options.update(kwargs)
+    return TransactionJournal(str(path), **options)
+
+
+def wait_until(predicate, timeout=3.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def txn(remark="lunch"):
+    return {"account_id": 1, "category_id": 1, "transaction_date": "2025-01-01", "amount": 10.0, "remark": remark}
+
+
+def test_append_is_replayed_and_checkpointed(tmp_path, db):
+    j = make_journal(tmp_path)
+    j.start()
+    try:
+        key = j.append("add", txn())
+        assert wait_until(lambda: j.status()["pending"] == 0)
+    finally:
+        j.stop()
+    assert [e["key"] for e in db.applied] == [key]
+    size = (tmp_path / JOURNAL_FILE).stat().st_size
+    assert int((tmp_path / CHECKPOINT_FILE).read_text()) == size
+
+
+def test_torn_tail_is_trimmed(tmp_path, db):
+    db.online = False
+    j = make_journal(tmp_path)
+    j.start()
+    j.append("add", txn("kept"))
+    j.stop()
+    with open(tmp_path / JOURNAL_FILE, "ab") as fh:
+        fh.write(b'{"key": "torn", "op": "add", "da')
+
+    j = make_journal(tmp_path)
+    j.start()
+    try:
+        assert [d["remark"] for _, d in j.pending_adds()] == ["kept"]
+        assert (tmp_path / JOURNAL_FILE).read_bytes().endswith(b"\n")
+    finally:
+        j.stop()
+
+
+def test_restart_resumes_from_checkpoint(tmp_path, db):
+    j = make_journal(tmp_path)
+    j.start()
+    j.append("add", txn("first"))
+    assert wait_until(lambda: j.status()["pending"] == 0)
+    db.online = False
+    j.append("add", txn("second"))
+    j.stop()
+
+    db.online = True
+    j = make_journal(tmp_path)
+    j.start()
+    try:
+        assert wait_until(lambda: j.status()["pending"] == 0)
+    finally:
+        j.stop()
+    assert [e["data"]["remark"] for e in db.applied] == ["first", "second"]
+
+
+def test_entries_survive_replay_failure_while_offline(tmp_path, db):
+    db.online = False
+    j = make_journal(tmp_path)
+    j.start()
+    j.append("add", txn("a"))
+    j.append("delete", {"id": 7})
+    assert wait_until(lambda: not j.status()["online"])
+    assert j.status()["pending"] == 2
+    assert j.pending_deletes() == {7}
+    j.stop()
+
+    j = make_journal(tmp_path)
+    j.start()
+    try:
+        assert j.status()["pending"] == 2
+        db.online = True
+        assert wait_until(lambda: j.status()["pending"] == 0)
+        assert j.status()["online"]
+    finally:
+        j.stop()
+    assert [e["op"] for e in db.applied] == ["add", "delete"]
+
+
+def test_compaction_then_restart(tmp_path, db):
+    j = make_journal(tmp_path, compact_bytes=1)
+    j.start()
+    j.append("add", txn())
+    assert wait_until(lambda: (tmp_path / JOURNAL_FILE).stat().st_size == 0)
+    j.stop()
+    assert int((tmp_path / CHECKPOINT_FILE).read_text()) == 0
+
+    db.online = False
+    j = make_journal(tmp_path, compact_bytes=1)
+    j.start()
+    try:
+        j.append("add", txn("after"))
+        assert [d["remark"] for _, d in j.pending_adds()] == ["after"]
+    finally:
+        j.stop()
+
+
+def test_stale_checkpoint_is_rewritten(tmp_path, db):
+    # Compaction truncated the journal, then crashed before resetting the checkpoint
+    db.online = False
+    (tmp_path / JOURNAL_FILE).write_bytes(b"")
+    (tmp_path / CHECKPOINT_FILE).write_text("100")
+
+    j = make_journal(tmp_path)
+    j.start()
+    assert int((tmp_path / CHECKPOINT_FILE).read_text()) == 0
+    for i in range(2):
+        j.append("add", txn(f"entry-{i}-" + "x" * 60))
+    j.stop()
+
+    j = make_journal(tmp_path)
+    j.start()
+    try:
+        assert j.status()["pending"] == 2
+    finally:
+        j.stop()
+
+
+def test_mid_entry_checkpoint_moves_to_next_entry(tmp_path, db):
+    db.online = False
+    first = json.dumps({"key": "k1", "op": "add", "data": txn("first")}) + "\n"
+    second = json.dumps({"key": "k2", "op": "delete", "data": {"id": 5}}) + "\n"
+    (tmp_path / JOURNAL_FILE).write_text(first + second)
+    (tmp_path / CHECKPOINT_FILE).write_text("10")
+
+    j = make_journal(tmp_path)
+    j.start()
+    try:
+        assert j.pending_adds() == []
+        assert j.pending_deletes() == {5}
+        assert int((tmp_path / CHECKPOINT_FILE).read_text()) == len(first)
+    finally:
+        j.stop()
+
+
+def test_unreadable_line_is_rejected_not_fatal(tmp_path, db):
+    db.online = False
+    good = json.dumps({"key": "k1", "op": "add", "data": txn("good")}) + "\n"
+    (tmp_path / JOURNAL_FILE).write_text("not json\n" + good)
+
+    j = make_journal(tmp_path)
+    j.start()
+    try:
+        assert [k for k, _ in j.pending_adds()] == ["k1"]
+        rejected = j.rejected_entries()
+        assert [e["op"] for e in rejected] == ["unreadable"]
+        assert "not json" in rejected[0]["data"]["raw"]
+    finally:
+        j.stop()
+
+
+def test_rejected_entries_reach_rejected_file(tmp_path, db):
+    db.reject["bad"] = "Selected category type does not match the category."
+    j = make_journal(tmp_path)
+    j.start()
+    try:
+        j.append("add", txn("bad"))
+        j.append("add", txn("good"))
+        assert wait_until(lambda: j.status()["pending"] == 0)
+        assert j.status()["rejected"] == 1
+        lines = (tmp_path / REJECTED_FILE).read_text().splitlines()
+        assert len(lines) == 1
+        entry = json.loads(lines[0])
+        assert entry["data"]["remark"] == "bad"
+        assert entry["reason"] == db.reject["bad"]
+
+        assert j.discard_rejected(entry["key"])
+        assert j.rejected_entries() == []
+        assert (tmp_path / REJECTED_FILE).read_text() == ""
+    finally:
+        j.stop()
+    assert [e["data"]["remark"] for e in db.applied] == ["good"]
+
+
+def test_failed_fsync_rolls_back_the_group(tmp_path, db, monkeypatch):
+    db.online = False
+    j = make_journal(tmp_path)
+    j.start()
+    try:
+        j.append("add", txn("kept"))
+        size = (tmp_path / JOURNAL_FILE).stat().st_size
+
+        real_fsync = journal_module.os.fsync
+        calls = {"n": 0}
+
+        def failing_fsync(fd):
+            calls["n"] += 1
+            if calls["n"] == 1:
+                raise OSError("disk full")
+            return real_fsync(fd)
+
+        monkeypatch.setattr(journal_module.os, "fsync", failing_fsync)
+        with pytest.raises(OSError):
+            j.append("add", txn("lost"))
+        monkeypatch.setattr(journal_module.os, "fsync", real_fsync)
+
+        assert (tmp_path / JOURNAL_FILE).stat().st_size == size
+        assert [d["remark"] for _, d in j.pending_adds()] == ["kept"]
+    finally:
+        j.stop()
+
+
+def test_append_after_stop_raises(tmp_path, db):
+    j = make_journal(tmp_path)
+    j.start()
+    j.stop()
+    with pytest.raises(RuntimeError):
+        j.append("add", txn())
+
+
+def test_stop_keeps_file_open_while_replayer_is_blocked(tmp_path, monkeypatch):
+    gate = threading.Event()
+    entered = threading.Event()
+
+    def slow_db(entries):
+        entered.set()
+        gate.wait(5)
+        return {}
+
+    monkeypatch.setattr(journal_module, "apply_journal_entries", slow_db)
+    j = make_journal(tmp_path, compact_bytes=1)
+    j.start()
+    j.append("add", txn())
+    assert entered.wait(3)
+    j.stop(timeout=0.1)
+    assert j._fh is not None
+
+    gate.set()
+    replayer = next(t for t in j._threads if t.name == "journal-replayer")
+    replayer.join(3)
+    assert not replayer.is_alive()
+    assert (tmp_path / JOURNAL_FILE).stat().st_size == 0
+
+
+def test_non_connection_error_rejects_only_the_bad_entry(tmp_path, db):
+    db.crash_on.add("malformed")
+    j = make_journal(tmp_path)
+    j.start()
+    try:
+        for remark in ("a", "b", "malformed", "c"):
+            j.append("add", txn(remark))
+        assert wait_until(lambda: j.status()["pending"] == 0)
+        rejected = j.rejected_entries()
+        assert [e["data"]["remark"] for e in rejected] == ["malformed"]
+        assert rejected[0]["reason"].startswith("KeyError")
+        assert j.status()["online"]
+    finally:
+        j.stop()
+    assert sorted(e["data"]["remark"] for e in db.applied) == ["a", "b", "c"]
+
+
+def test_connection_error_keeps_the_batch_pending(tmp_path, db):
+    db.online = False
+    j = make_journal(tmp_path)
+    j.start()
+    try:
+        j.append("add", txn())
+        assert wait_until(lambda: not j.status()["online"])
+        assert j.status()["pending"] == 1
+        assert j.rejected_entries() == []
+    finally:
+        j.stop()
@@ -0,0 +1,211 @@
+import json
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from decimal import Decimal
+from pathlib import Path
+
+import pytest
+
+import app.services.statements as statements
+from app.config import settings
+from app.services.statements import _period_bounds, _account_dir, generate_statement, generate_statements
+
+
+class FakeSession:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, stmt):
+        if isinstance(self.rows, Exception):
+            raise self.rows
+        return iter(self.rows)
+
+
+def make_job(period="2025-01", rows=1, opening="100.00", actuals=(), fingerprint="f1", account_id=1,
+             account_name="BCA"):
+    start, end = _period_bounds("month", period)
+    return {
+        "account_id": account_id,
+        "account_name": account_name,
+        "granularity": "month",
+        "period": period,
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        "rows": rows,
+        "opening": opening,
+        "actuals": list(actuals),
+        "fingerprint": fingerprint,
+    }
+
+
+def test_period_bounds():
+    assert _period_bounds("month", "2024-12") == (date(2024, 12, 1), date(2024, 12, 31))
+    assert _period_bounds("month", "2024-02") == (date(2024, 2, 1), date(2024, 2, 29))
+    assert _period_bounds("month", "2025-02") == (date(2025, 2, 1), date(2025, 2, 28))
+    assert _period_bounds("year", "2025") == (date(2025, 1, 1), date(2025, 12, 31))
+
+
+def test_account_dir_is_filesystem_safe():
+    assert _account_dir(1, "BCA") == "1_BCA"
+    assert _account_dir(2, "My Bank/Savings") == "2_My_Bank_Savings"
+
+
+def test_actual_balance_checked_at_end_of_its_day(tmp_path, monkeypatch):
+    rows = [
+        (1, date(2025, 1, 10), "Salary", "Debit", Decimal("50.00"), None),
+        (2, date(2025, 1, 10), "Food", "Credit", Decimal("20.00"), "lunch"),
+        (3, date(2025, 1, 11), "Food", "Credit", Decimal("5.00"), None),
+    ]
+    monkeypatch.setattr(statements, "SessionLocal", lambda: FakeSession(rows))
+    job = make_job(rows=3, actuals=[("2025-01-10", "130.00"), ("2025-01-31", "125.00")])
+
+    result = generate_statement(job, str(tmp_path))
+    summary = result["summary"]
+
+    assert summary["closing_balance"] == 125.0
+    assert [c["computed"] for c in summary["actual_balance_checks"]] == [130.0, 125.0]
+    assert summary["reconciled"]
+    assert summary["categories"] == [{"category": "Food", "total": 25.0}, {"category": "Salary", "total": 50.0}]
+    csv_lines = Path(result["files"][0]).read_text().splitlines()
+    assert csv_lines[1:] == ["1,2025-01-10,Salary,Debit,50.00,150.00,",
+                             "2,2025-01-10,Food,Credit,20.00,130.00,lunch",
+                             "3,2025-01-11,Food,Credit,5.00,125.00,"]
+
+
+def test_period_without_transactions_checks_carried_balance(tmp_path, monkeypatch):
+    monkeypatch.setattr(statements, "SessionLocal", lambda: FakeSession(RuntimeError("no query expected")))
+    job = make_job(rows=0, actuals=[("2025-01-15", "90.00")])
+
+    summary = generate_statement(job, str(tmp_path))["summary"]
+
+    assert summary["opening_balance"] == summary["closing_balance"] == 100.0
+    assert summary["actual_balance_checks"] == [
+        {"date": "2025-01-15", "actual": 90.0, "computed": 100.0, "difference": -10.0}
+    ]
+    assert not summary["reconciled"]
+
+
+def test_failed_worker_leaves_no_temp_files(tmp_path, monkeypatch):
+    monkeypatch.setattr(statements, "SessionLocal", lambda: FakeSession(ConnectionError("db down")))
+
+    with pytest.raises(ConnectionError):
+        generate_statement(make_job(), str(tmp_path))
+
+    assert [p for p in tmp_path.rglob("*") if p.is_file()] == []
+
+
+@pytest.fixture
+def orchestration(tmp_path, monkeypatch):
+    """Run generate_statements in-process against a planned job list."""
+    state = {"jobs": [], "generated": []}
+
+    def fake_generate(job, out_dir):
+        state["generated"].append(statements._job_id(job))
+        if job["period"] in state.get("fail", ()):
+            raise RuntimeError("worker failed")
+        path = Path(out_dir) / _account_dir(job["account_id"], job["account_name"]) / f"{job['period']}.json"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(job))
+        return {"summary": {}, "files": [str(path)], "seconds": 0.0}
+
+    monkeypatch.setattr(settings, "EXPORT_DIR", str(tmp_path))
+    monkeypatch.setattr(statements, "plan_statement_jobs", lambda granularities, account_ids: state["jobs"])
+    monkeypatch.setattr(statements, "generate_statement", fake_generate)
+    monkeypatch.setattr(statements, "ProcessPoolExecutor", ThreadPoolExecutor)
+
+    def run(**kwargs):
+        state["generated"] = []
+        report = generate_statements(("month",), max_workers=2, **kwargs)
+        return report, sorted(state["generated"])
+
+    state["run"] = run
+    return state
+
+
+def test_unchanged_periods_are_skipped(orchestration):
+    orchestration["jobs"] = [make_job("2025-01"), make_job("2025-02")]
+    report, generated = orchestration["run"]()
+    assert generated == ["1/month/2025-01", "1/month/2025-02"]
+
+    report, generated = orchestration["run"]()
+    assert generated == []
+    assert report["skipped"] == 2
+
+    orchestration["jobs"] = [make_job("2025-01"), make_job("2025-02", fingerprint="f2")]
+    report, generated = orchestration["run"]()
+    assert generated == ["1/month/2025-02"]
+
+    report, generated = orchestration["run"](force=True)
+    assert generated == ["1/month/2025-01", "1/month/2025-02"]
+
+
+def test_missing_output_is_regenerated(orchestration, tmp_path):
+    orchestration["jobs"] = [make_job("2025-01")]
+    orchestration["run"]()
+    (tmp_path / "statements" / "1_BCA" / "2025-01.json").unlink()
+
+    _, generated = orchestration["run"]()
+    assert generated == ["1/month/2025-01"]
+
+
+def test_unplanned_periods_are_removed(orchestration, tmp_path):
+    out_dir = tmp_path / "statements"
+    orchestration["jobs"] = [make_job("2025-01"), make_job("2025-02")]
+    orchestration["run"]()
+
+    # A filtered run must not prune other accounts' statements
+    orchestration["jobs"] = [make_job("2025-01", account_id=2)]
+    report, _ = orchestration["run"](account_ids=[2])
+    assert report["removed"] == []
+    assert (out_dir / "1_BCA" / "2025-02.json").exists()
+
+    orchestration["jobs"] = [make_job("2025-01"), make_job("2025-01", account_id=2)]
+    report, _ = orchestration["run"]()
+    assert report["removed"] == ["1/month/2025-02"]
+    assert not (out_dir / "1_BCA" / "2025-02.json").exists()
+    manifest = json.loads((out_dir / statements.MANIFEST_FILE).read_text())
+    assert sorted(manifest) == ["1/month/2025-01", "2/month/2025-01"]
+
+
+def test_account_rename_removes_old_outputs(orchestration, tmp_path):
+    out_dir = tmp_path / "statements"
+    orchestration["jobs"] = [make_job("2025-01")]
+    orchestration["run"]()
+
+    orchestration["jobs"] = [make_job("2025-01", account_name="BCA Main", fingerprint="f2")]
+    orchestration["run"]()
+
+    assert not (out_dir / "1_BCA").exists()
+    assert (out_dir / "1_BCA_Main" / "2025-01.json").exists()
+
+
+def test_failed_job_keeps_previous_files_tracked(orchestration, tmp_path):
+    out_dir = tmp_path / "statements"
+    orchestration["jobs"] = [make_job("2025-01"), make_job("2025-02")]
+    orchestration["run"]()
+
+    orchestration["fail"] = {"2025-02"}
+    orchestration["jobs"] = [make_job("2025-01"), make_job("2025-02", fingerprint="f2")]
+    report, _ = orchestration["run"]()
+    assert report["failed"] == ["1/month/2025-02"]
+    manifest = json.loads((out_dir / statements.MANIFEST_FILE).read_text())
+    assert manifest["1/month/2025-02"]["fingerprint"] is None
+
+    # Retried next run even though the fingerprint matches what was planned before
+    orchestration["fail"] = set()
+    orchestration["jobs"] = [make_job("2025-01"), make_job("2025-02")]
+    _, generated = orchestration["run"]()
+    assert generated == ["1/month/2025-02"]
+
+    orchestration["fail"] = {"2025-02"}
+    orchestration["run"]()
+    orchestration["jobs"] = [make_job("2025-01")]
+    report, _ = orchestration["run"]()
+    assert report["removed"] == ["1/month/2025-02"]
+    assert not (out_dir / "1_BCA" / "2025-02.json").exists()